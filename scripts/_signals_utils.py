@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import json, datetime, urllib.request
+import datetime, gzip, http.client, json, os, threading, urllib.error, urllib.parse, urllib.request
+from functools import lru_cache
+from typing import Tuple
 
 def now_iso() -> str:
     return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -13,6 +15,55 @@ def fetch_json(url: str, timeout: int = 20) -> dict:
     except Exception:
         return {}
 
+# ---- keep-alive GET: one persistent connection per (thread, host), so TLS is negotiated once ----
+_http_local = threading.local()
+
+def _keepalive_conn(scheme: str, host: str, timeout: int) -> http.client.HTTPConnection:
+    conns = getattr(_http_local, "conns", None)
+    if conns is None:
+        conns = _http_local.conns = {}
+    conn = conns.get((scheme, host))
+    if conn is None:
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        conn = conns[(scheme, host)] = cls(host, timeout=timeout)
+    return conn
+
+def _drop_conn(scheme: str, host: str) -> None:
+    conn = getattr(_http_local, "conns", {}).pop((scheme, host), None)
+    if conn is not None:
+        conn.close()
+
+def keepalive_get(url: str, headers: dict, timeout: int = 30) -> bytes:
+    """
+    GET url over the calling thread's pooled connection and return the (gunzipped) body.
+    Reconnects once if the server dropped the idle connection; timeouts and other errors
+    propagate on the first attempt. Status >= 400 raises urllib.error.HTTPError.
+    """
+    u = urllib.parse.urlsplit(url)
+    path = f"{u.path}?{u.query}" if u.query else u.path
+    for attempt in (1, 2):
+        conn = _keepalive_conn(u.scheme, u.netloc, timeout)
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            _drop_conn(u.scheme, u.netloc)
+            if attempt == 2:
+                raise
+            continue
+        except (http.client.HTTPException, OSError):
+            _drop_conn(u.scheme, u.netloc)
+            raise
+        if resp.status >= 400:
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+        if resp.getheader("Content-Encoding") == "gzip":
+            try:
+                body = gzip.decompress(body)
+            except Exception:
+                pass
+        return body
+
 def load_json(path: str) -> dict:
     try: return json.load(open(path,"r",encoding="utf-8"))
     except Exception: return {}
@@ -20,6 +71,67 @@ def load_json(path: str) -> dict:
 def save_json(path: str, obj: dict) -> None:
     json.dump(obj, open(path,"w",encoding="utf-8"), ensure_ascii=False, separators=(",",":"))
 
+def write_json_atomic(path: str, obj, **dumps_kw) -> None:
+    """Write obj as JSON to a sibling .tmp file, then rename it over path."""
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps(obj, **dumps_kw))  # dumps uses the C encoder; dump does not
+    os.replace(tmp, path)
+
+# ---- on-disk Polygon bar caches; an empty path disables them ----
+# Window caches (4H, daily) store {key: {"from": window start, "rows": [[t, o, h, l, c, v], ...]}}
+# via window_cache_entry; the hourly-source cache stores bare row lists {key: [[t, o, h, l, c, v], ...]}.
+BAR_CACHE_TOL = 0.005  # relative close drift on the overlap bar that invalidates a cache
+
+def load_bar_cache(path: str) -> dict:
+    if not path:
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            js = json.load(f)
+        return js if isinstance(js, dict) else {}
+    except Exception:
+        return {}
+
+def save_bar_cache(path: str, cache: dict) -> None:
+    if path:
+        write_json_atomic(path, cache, separators=(",", ":"))
+
+def window_cache_rows(cache: dict, key: str, cutoff: int) -> list:
+    """
+    Rows at/after cutoff from a {"from": start, "rows": [...]} window entry. An entry that
+    was not fetched back to cutoff (or an old bare-list one) yields [], forcing a full fetch.
+    """
+    ent = cache.get(key)
+    if not isinstance(ent, dict) or not isinstance(ent.get("from"), int) or ent["from"] > cutoff:
+        return []
+    return [r for r in (ent.get("rows") or []) if r[0] >= cutoff]
+
+def window_cache_entry(cutoff: int, rows: list) -> dict:
+    return {"from": cutoff, "rows": rows}
+
+def cache_agrees(cached: list, fresh_close: dict, tol: float = BAR_CACHE_TOL) -> bool:
+    """
+    The tail fetch re-reads the last cached day, so the two overlap. If the first shared
+    bar's close moved (split/adjustment), the cached history is stale. No shared bar at all
+    (an empty or truncated tail) also counts as disagreement.
+    """
+    for r in cached:
+        c = fresh_close.get(r[0])
+        if c is not None:
+            return abs(c - r[4]) <= tol * max(abs(r[4]), 1e-9)
+    return False
+
+@lru_cache(maxsize=None)
+def psi_x_terms(length: int) -> Tuple[Tuple[float, ...], float]:
+    """Lux PSI correlates against bar index 0..length-1: (x - xbar) terms and their sum of squares."""
+    xbar = sum(range(length)) / length
+    dxs = tuple(x - xbar for x in range(length))
+    return dxs, sum(dx ** 2 for dx in dxs)
+
 def carry_last_changed(prev_sig: dict, new_state: str, stamp: str):
     """Keep lastChanged unless the state actually flips."""
     prev_state = (prev_sig or {}).get("state")
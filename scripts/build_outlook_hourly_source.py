@@ -59,17 +59,20 @@ from __future__ import annotations
 
 import argparse
 import csv
+import http.client
 import json
 import os
 import sys
 import time
 import urllib.error
 import urllib.parse
-import urllib.request
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import date, datetime, timedelta, timezone
+from operator import itemgetter
 from typing import Any, Dict, List, Optional, Tuple
 
+from _signals_utils import cache_agrees, keepalive_get, load_bar_cache, save_bar_cache, write_json_atomic
+
 UTC = timezone.utc
 
 def now_utc_iso() -> str:
@@ -93,22 +96,23 @@ DEFAULT_OUT_PATH    = os.path.join("data", "outlook_source.json")
 MAX_WORKERS    = int(os.environ.get("FD_MAX_WORKERS", "6"))
 LOOKBACK_HOURS = int(os.environ.get("HOUR_LOOKBACK_HOURS", "72"))  # 3 days of 1h bars
 
+# Optional per-symbol cache of the last completed 1h bars (flags read only the last 11).
+BAR_CACHE_PATH = os.environ.get("HOURLY_BAR_CACHE", "")
+BAR_CACHE_KEEP = 16
+BAR_CACHE: Dict[str, Any] = {}
+
 # ------------------------ HTTP ------------------------
 
-def http_get(url: str, timeout: int = 20) -> str:
-    req = urllib.request.Request(
-        url,
-        headers={"User-Agent": "ferrari-dashboard/hourly-builder", "Accept-Encoding": "gzip"},
-    )
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        data = resp.read()
-        try:
-            import gzip
-            if resp.getheader("Content-Encoding") == "gzip":
-                data = gzip.decompress(data)
-        except Exception:
-            pass
-        return data.decode("utf-8")
+_HTTP_HEADERS = {"User-Agent": "ferrari-dashboard/hourly-builder", "Accept-Encoding": "gzip"}
+
+def http_get(url: str, timeout: int = 20) -> bytes:
+    try:
+        return keepalive_get(url, _HTTP_HEADERS, timeout)
+    except urllib.error.HTTPError:
+        raise
+    except (http.client.HTTPException, OSError) as e:
+        # surface transport failures like urlopen would, so poly_json's retry sees a URLError
+        raise urllib.error.URLError(e)
 
 def poly_json(url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     if params is None:
@@ -139,33 +143,83 @@ def poly_json(url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, An
 def dstr(d: date) -> str:
     return d.strftime("%Y-%m-%d")
 
-def fetch_hourly_bars(ticker: str, hours: int) -> List[Dict[str, Any]]:
+def _fetch_hourly_range(ticker: str, start_date: date, end_date: date) -> Optional[List[Dict[str, Any]]]:
+    url = f"{POLY_BASE}/v2/aggs/ticker/{ticker}/range/1/hour/{dstr(start_date)}/{dstr(end_date)}"
+    js = poly_json(url, {"adjusted": "true", "sort": "asc", "limit": 50000})
+    if not js or js.get("status") != "OK":
+        return None
+    return _parse_rows(js.get("results", []) or [])
+
+def _parse_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # fast path; the forgiving per-row parse only runs for a malformed row
+    try:
+        out = [
+            {
+                "t": int(r["t"]),
+                "o": float(r["o"]),
+                "h": float(r["h"]),
+                "l": float(r["l"]),
+                "c": float(r["c"]),
+                "v": float(r["v"]),
+            }
+            for r in rows
+        ]
+    except (KeyError, TypeError, ValueError, OverflowError):
+        out = []
+        for r in rows:
+            try:
+                out.append({
+                    "t": int(r.get("t", 0)),
+                    "o": float(r.get("o", 0.0)),
+                    "h": float(r.get("h", 0.0)),
+                    "l": float(r.get("l", 0.0)),
+                    "c": float(r.get("c", 0.0)),
+                    "v": float(r.get("v", 0.0)),
+                })
+            except Exception:
+                continue
+    out.sort(key=itemgetter("t"))
+    return out
+
+def hourly_window(hours: int) -> Tuple[date, date, int]:
     """
-    Fetch ~hours of 60-minute bars for ticker.
-    We'll convert to a "bars" list compatible with compute_flags_from_bars.
+    (start_date, end_date, start cutoff in ms) for the hourly lookback. main() computes it
+    once per run and hands it to every worker, so they all request the same date range.
     """
     end_date = datetime.now(UTC).date()
     # approximate days: hours/6 + cushion
     days = max(2, hours // 6 + 2)
     start_date = end_date - timedelta(days=days)
-    url = f"{POLY_BASE}/v2/aggs/ticker/{ticker}/range/1/hour/{dstr(start_date)}/{dstr(end_date)}"
-    js = poly_json(url, {"adjusted": "true", "sort": "asc", "limit": 50000})
-    if not js or js.get("status") != "OK":
-        return []
-    out: List[Dict[str, Any]] = []
-    for r in js.get("results", []) or []:
-        try:
-            out.append({
-                "t": int(r.get("t", 0)),
-                "o": float(r.get("o", 0.0)),
-                "h": float(r.get("h", 0.0)),
-                "l": float(r.get("l", 0.0)),
-                "c": float(r.get("c", 0.0)),
-                "v": float(r.get("v", 0.0)),
-            })
-        except Exception:
-            continue
-    out.sort(key=lambda x: x["t"])
+    cutoff = int(datetime(start_date.year, start_date.month, start_date.day, tzinfo=UTC).timestamp()) * 1000
+    return start_date, end_date, cutoff
+
+def fetch_hourly_bars(ticker: str, window: Tuple[date, date, int]) -> List[Dict[str, Any]]:
+    """
+    Fetch the 60-minute bars for ticker over window (see hourly_window).
+    We'll convert to a "bars" list compatible with compute_flags_from_bars.
+    With HOURLY_BAR_CACHE set, only the tail from the last cached bar's day is requested
+    and merged over the cached rows ([t, o, h, l, c, v]).
+    """
+    start_date, end_date, cutoff = window
+
+    out: Optional[List[Dict[str, Any]]] = None
+    if BAR_CACHE_PATH:
+        cached = [r for r in (BAR_CACHE.get(ticker) or []) if r[0] >= cutoff]
+        if cached:
+            tail_start = max(start_date, datetime.fromtimestamp(cached[-1][0] // 1000, UTC).date())
+            fresh = _fetch_hourly_range(ticker, tail_start, end_date)
+            if fresh is None:
+                return []
+            if cache_agrees(cached, {b["t"]: b["c"] for b in fresh}):
+                merged = {r[0]: {"t": r[0], "o": r[1], "h": r[2], "l": r[3], "c": r[4], "v": r[5]} for r in cached}
+                merged.update((b["t"], b) for b in fresh)
+                out = sorted(merged.values(), key=lambda x: x["t"])
+
+    if out is None:
+        out = _fetch_hourly_range(ticker, start_date, end_date)
+        if out is None:
+            return []
+
     # drop in-flight hour
     if out:
         last = out[-1]["t"] // 1000
@@ -173,6 +227,9 @@ def fetch_hourly_bars(ticker: str, hours: int) -> List[Dict[str, Any]]:
         # if last bar is current in-flight hour, drop it
         if (last // 3600) == (now // 3600):
             out = out[:-1]
+
+    if BAR_CACHE_PATH:
+        BAR_CACHE[ticker] = [[b["t"], b["o"], b["h"], b["l"], b["c"], b["v"]] for b in out[-BAR_CACHE_KEEP:]]
     return out
 
 # ------------------------ SECTOR CSV HELPERS ------------------------
@@ -180,11 +237,19 @@ def fetch_hourly_bars(ticker: str, hours: int) -> List[Dict[str, Any]]:
 def read_symbols(path: str) -> List[str]:
     syms: List[str] = []
     with open(path, newline="", encoding="utf-8-sig") as f:
-        r = csv.DictReader(f)
+        r = csv.reader(f)
+        hdr = next(r, None) or []
+        # only one column is needed: find it once instead of building a dict per row
+        col = "Symbol" if "Symbol" in hdr else "symbol"
+        if col not in hdr:
+            return syms
+        # DictReader semantics: the last column with a duplicated name wins
+        idx = len(hdr) - 1 - hdr[::-1].index(col)
         for row in r:
-            s = (row.get("Symbol") or row.get("symbol") or "").strip().upper()
-            if s:
-                syms.append(s)
+            if len(row) > idx:
+                s = row[idx].strip().upper()
+                if s:
+                    syms.append(s)
     return syms
 
 def discover_sectors(sectors_dir: str) -> Dict[str, List[str]]:
@@ -217,65 +282,82 @@ def compute_flags_from_bars(bars: List[Dict[str, Any]]) -> Tuple[int, int, int,
         return 0, 0, 0, 0
     today   = bars[-1]
     prior10 = bars[-11:-1]
-    if not prior10:
-        return 0, 0, 0, 0
     try:
-        is_10NH = int(today["h"] > max(b["h"] for b in prior10))
-        is_10NL = int(today["l"] < min(b["l"] for b in prior10))
+        is_10NH = int(today["h"] > max([b["h"] for b in prior10]))
+        is_10NL = int(today["l"] < min([b["l"] for b in prior10]))
     except Exception:
         is_10NH = is_10NL = 0
-    last3 = bars[-3:]
     try:
-        is_3U = int(len(last3) == 3 and (last3[0]["c"] < last3[1]["c"] < last3[2]["c"]))
-        is_3D = int(len(last3) == 3 and (last3[0]["c"] > last3[1]["c"] > last3[2]["c"]))
+        c1, c2, c3 = bars[-3]["c"], bars[-2]["c"], today["c"]
+        is_3U = int(c1 < c2 < c3)
+        is_3D = int(c1 > c2 > c3)
     except Exception:
         is_3U = is_3D = 0
     return is_10NH, is_10NL, is_3U, is_3D
 
 # ------------------------ SECTOR AGG PIPELINE ------------------------
 
-def process_symbol(ticker: str, hours: int) -> Tuple[int, int, int, int]:
+def process_symbol(ticker: str, window: Tuple[date, date, int]) -> Tuple[int, int, int, int]:
     try:
-        bars = fetch_hourly_bars(ticker, hours)
+        bars = fetch_hourly_bars(ticker, window)
         if not bars:
             return 0, 0, 0, 0
-        return compute_flags_from_bars(
-            [{"h": b["h"], "l": b["l"], "c": b["c"]} for b in bars]
-        )
+        # flags only look at the last 11 bars; no need to copy the whole series
+        return compute_flags_from_bars(bars[-11:])
     except SystemExit:
         raise
     except Exception:
         return 0, 0, 0, 0
 
-def process_sector(sector: str, symbols: List[str], hours: int) -> Dict[str, Any]:
-    nh = nl = u = d = 0
-    if not symbols:
-        return {"sector": sector, "nh":0, "nl":0, "u":0, "d":0}
+def fetch_symbol_flags(symbols: List[str], window: Tuple[date, date, int]) -> Dict[str, Tuple[int, int, int, int]]:
+    """Fetch + flag every symbol once; sectors then just sum the shared results."""
+    flags: Dict[str, Tuple[int, int, int, int]] = {}
+    inflight: Dict[Future, str] = {}
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-        futures = {ex.submit(process_symbol, sym, hours): sym for sym in symbols}
-        for fut in as_completed(futures):
-            sym = futures[fut]
+    def collect(done) -> None:
+        for fut in done:
+            sym = inflight.pop(fut)
             try:
-                f_nh, f_nl, f_u, f_d = fut.result()
-                nh += f_nh
-                nl += f_nl
-                u  += f_u
-                d  += f_d
+                flags[sym] = fut.result()
             except Exception:
                 continue
 
+    # keep at most 2x workers queued: results are folded in as they land and
+    # a 429 backoff in the workers naturally slows further submission
+    max_inflight = max(1, MAX_WORKERS) * 2
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        for sym in symbols:
+            if len(inflight) >= max_inflight:
+                collect(wait(inflight, return_when=FIRST_COMPLETED)[0])
+            inflight[ex.submit(process_symbol, sym, window)] = sym
+        collect(wait(inflight)[0])
+    return flags
+
+def process_sector(sector: str, symbols: List[str], flags: Dict[str, Tuple[int, int, int, int]]) -> Dict[str, Any]:
+    nh = nl = u = d = 0
+    for sym in symbols:
+        f_nh, f_nl, f_u, f_d = flags.get(sym, (0, 0, 0, 0))
+        nh += f_nh
+        nl += f_nl
+        u  += f_u
+        d  += f_d
     return {"sector": sector, "nh": nh, "nl": nl, "u": u, "d": d}
 
-def compute_sector_cards(sectors_dir: str, hours: int) -> List[Dict[str, Any]]:
+def compute_sector_cards(sectors_dir: str, window: Tuple[date, date, int]) -> List[Dict[str, Any]]:
     sectors_map = discover_sectors(sectors_dir)
     print("[hourly-src] discovered sectors:", ", ".join(sorted(sectors_map.keys())), flush=True)
 
+    # a symbol listed in several sector CSVs is fetched once
+    universe = sorted(set().union(*sectors_map.values()))
+    slots = sum(len(v) for v in sectors_map.values())
+    print(f"[hourly-src] fetching {len(universe)} unique symbols ({slots} sector slots)", flush=True)
+    flags = fetch_symbol_flags(universe, window)
+
     cards: List[Dict[str, Any]] = []
 
     for sector_name, syms in sorted(sectors_map.items()):
         print(f"[hourly-src] sector {sector_name}: {len(syms)} symbols", flush=True)
-        agg = process_sector(sector_name, syms, hours)
+        agg = process_sector(sector_name, syms, flags)
         nh = agg["nh"]
         nl = agg["nl"]
         up = agg["u"]
@@ -339,7 +421,9 @@ def main() -> int:
                 "down": 0,
             })
     else:
-        cards = compute_sector_cards(args.sectors_dir, args.hours)
+        BAR_CACHE.update(load_bar_cache(BAR_CACHE_PATH))
+        cards = compute_sector_cards(args.sectors_dir, hourly_window(args.hours))
+        save_bar_cache(BAR_CACHE_PATH, BAR_CACHE)
 
     out_obj: Dict[str, Any] = {
         "mode": "hourly",
@@ -352,9 +436,7 @@ def main() -> int:
     }
 
     out_path = args.out
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(out_obj, f, ensure_ascii=False, separators=(",", ":"))
+    write_json_atomic(out_path, out_obj, ensure_ascii=False, separators=(",", ":"))
 
     print(f"[hourly-src] wrote hourly source to {out_path}", flush=True)
     return 0
@@ -23,9 +23,22 @@ import sys
 import time
 import urllib.parse
 import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from operator import itemgetter
 from typing import Any, List, Optional, Tuple
 
+from _signals_utils import (
+    cache_agrees,
+    load_bar_cache,
+    psi_x_terms,
+    save_bar_cache,
+    window_cache_entry,
+    window_cache_rows,
+    write_json_atomic,
+)
+
 UTC = timezone.utc
 
 POLY_4H_URL = (
@@ -49,6 +62,8 @@ B2_LIMIT = int(os.environ.get("B2_LIMIT_4H_SOURCE", "1200"))
 
 OFFENSIVE = {"information technology", "consumer discretionary", "communication services", "industrials"}
 DEFENSIVE = {"consumer staples", "utilities", "health care", "real estate"}
+# risk-on vote side per sector: +1 offensive (wants breadth >= 55), -1 defensive (wants breadth <= 45)
+SECTOR_SIDE = {**{s: 1 for s in OFFENSIVE}, **{s: -1 for s in DEFENSIVE}}
 
 FULL_EMA_DIST = 0.90
 
@@ -71,26 +86,38 @@ W_VOL = 0.05
 W_RISKON = 0.05
 
 PSI_WIN_4H = int(os.environ.get("PSI_WIN_4H", "STATEFUL")) if os.environ.get("PSI_WIN_4H", "").isdigit() else 0
-FETCH_DAYS_4H = int(os.environ.get("FETCH_DAYS_4H", "720"))
+PSI_CONV_4H = 50
+PSI_LEN_4H = 20
+
+# Lux PSI seeds its envelope at 0 and decays toward price by 1/conv per bar, so the
+# stateful value only stops depending on history once (1 - 1/conv)^n is negligible.
+# EMA200 also needs 200 bars. Assume ~2 SPY 4H bars per session, 5 sessions per
+# 7 calendar days, plus holiday slack.
+PSI_SEED_TOL_4H = 1e-5
+MIN_BARS_4H = max(
+    200,
+    math.ceil(math.log(PSI_SEED_TOL_4H) / math.log(1.0 - 1.0 / PSI_CONV_4H)),
+    SMI_K_LEN + 2 * SMI_D_LEN + SMI_EMA_LEN + 10,
+)
+FETCH_DAYS_4H = int(os.environ.get("FETCH_DAYS_4H", str(math.ceil(MIN_BARS_4H / 2 * 7 / 5) + 10)))
 STRUCTURE_MIN_1H_BUILT_BARS = int(os.environ.get("STRUCTURE_MIN_1H_BUILT_BARS", "60"))
 
+# Optional on-disk Polygon bar cache (empty = disabled). Steady-state runs then only pull the tail.
+BAR_CACHE_PATH = os.environ.get("BAR_CACHE_4H", "")
+BAR_CACHE: dict = {}
+BAR_CACHE_END_SLACK_S = 4 * 86400  # weekend + holiday between the last bar and today
+
 
 def now_utc_iso() -> str:
     return datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
 def clamp(x: float, lo: float, hi: float) -> float:
-    try:
-        return max(lo, min(hi, float(x)))
-    except Exception:
-        return lo
+    return max(lo, min(hi, float(x)))
 
 
 def pct(a: float, b: float) -> float:
-    try:
-        return 0.0 if b <= 0 else 100.0 * float(a) / float(b)
-    except Exception:
-        return 0.0
+    return 0.0 if b <= 0 else 100.0 * float(a) / float(b)
 
 
 def avg_last(vals: List[float], n: int) -> Optional[float]:
@@ -108,44 +135,88 @@ def fetch_json(url: str, timeout: int = 30) -> Any:
         headers={"User-Agent": "make-dashboard/4h/r20", "Cache-Control": "no-store"},
     )
     with urllib.request.urlopen(req, timeout=timeout) as resp:
-        return json.loads(resp.read().decode("utf-8"))
-
+        return json.loads(resp.read())
 
-def _fetch_polygon_range(sym: str, key: str, lookback_days: int, url_template: str, timeout: int = 25) -> List[dict]:
-    end = datetime.now(UTC).date()
-    start = end - timedelta(days=lookback_days)
-    url = url_template.format(sym=sym, start=start, end=end, key=key)
 
+def _poly_range_rows(url: str, timeout: int) -> Optional[List[dict]]:
+    """Parsed Polygon aggregate rows (t in seconds), or None when the request failed."""
     try:
         js = fetch_json(url, timeout=timeout)
     except Exception:
-        return []
+        return None
 
-    rows = js.get("results") or []
     out: List[dict] = []
-
-    for r in rows:
+    for r in js.get("results") or []:
         try:
             t = int(r.get("t", 0)) // 1000
-            out.append(
-                {
-                    "time": t,
-                    "open": float(r.get("o", 0)),
-                    "high": float(r.get("h", 0)),
-                    "low": float(r.get("l", 0)),
-                    "close": float(r.get("c", 0)),
-                    "volume": float(r.get("v", 0)),
-                }
-            )
+            out.append({
+                "time": t,
+                "open": float(r.get("o", 0)),
+                "high": float(r.get("h", 0)),
+                "low": float(r.get("l", 0)),
+                "close": float(r.get("c", 0)),
+                "volume": float(r.get("v", 0)),
+            })
         except Exception:
             continue
+    return out
+
+
+def _fetch_polygon_range(
+    sym: str,
+    key: str,
+    lookback_days: int,
+    url_template: str,
+    timeout: int = 25,
+    cache_tag: str = "",
+) -> List[dict]:
+    """
+    Fetch Polygon aggregates for the lookback window.
+    With a BAR_CACHE_4H file, only the tail from the last cached bar's day is requested
+    and merged over the cached rows ([t, o, h, l, c, v]). The whole window is refetched
+    when the cache does not reach back to the window start or the overlap bar moved,
+    and a series that stops short of today is not cached.
+    """
+    end = datetime.now(UTC).date()
+    start = end - timedelta(days=lookback_days)
+    cutoff = int(datetime(start.year, start.month, start.day, tzinfo=UTC).timestamp())
+
+    ck = f"{sym}:{cache_tag}" if (BAR_CACHE_PATH and cache_tag) else ""
+    cached = window_cache_rows(BAR_CACHE, ck, cutoff) if ck else []
+
+    out: Optional[List[dict]] = None
+    if cached:
+        tail_start = max(start, datetime.fromtimestamp(cached[-1][0], UTC).date())
+        fresh = _poly_range_rows(url_template.format(sym=sym, start=tail_start, end=end, key=key), timeout)
+        if fresh is None:
+            return []
+        if cache_agrees(cached, {b["time"]: b["close"] for b in fresh}):
+            merged: dict[int, dict] = {
+                r[0]: {"time": r[0], "open": r[1], "high": r[2], "low": r[3], "close": r[4], "volume": r[5]}
+                for r in cached
+            }
+            merged.update((b["time"], b) for b in fresh)
+            out = sorted(merged.values(), key=lambda x: x["time"])
+
+    if out is None:
+        fresh = _poly_range_rows(url_template.format(sym=sym, start=start, end=end, key=key), timeout)
+        if fresh is None:
+            return []
+        out = sorted({b["time"]: b for b in fresh}.values(), key=lambda x: x["time"])
+
+    # limit=50000 counts base minute aggregates, so a long window can come back cut short
+    # (sort=asc keeps the oldest bars). Only cache a series that reaches the last few sessions.
+    end_ts = int(datetime(end.year, end.month, end.day, tzinfo=UTC).timestamp())
+    if ck and out and out[-1]["time"] >= end_ts - BAR_CACHE_END_SLACK_S:
+        BAR_CACHE[ck] = window_cache_entry(
+            cutoff, [[b["time"], b["open"], b["high"], b["low"], b["close"], b["volume"]] for b in out]
+        )
 
-    out.sort(key=lambda x: x["time"])
     return out
 
 
 def fetch_polygon_4h(sym: str, key: str, lookback_days: int, keep_live: bool = False) -> List[dict]:
-    out = _fetch_polygon_range(sym, key, lookback_days, POLY_4H_URL)
+    out = _fetch_polygon_range(sym, key, lookback_days, POLY_4H_URL, cache_tag="240m")
 
     if out and not keep_live:
         now_ts = int(time.time())
@@ -157,11 +228,11 @@ def fetch_polygon_4h(sym: str, key: str, lookback_days: int, keep_live: bool = F
 
 
 def fetch_polygon_1h(sym: str, key: str, lookback_days: int) -> List[dict]:
-    return _fetch_polygon_range(sym, key, lookback_days, POLY_1H_URL)
+    return _fetch_polygon_range(sym, key, lookback_days, POLY_1H_URL, cache_tag="60m")
 
 
 def fetch_polygon_10m(sym: str, key: str, lookback_days: int) -> List[dict]:
-    return _fetch_polygon_range(sym, key, lookback_days, POLY_10M_URL)
+    return _fetch_polygon_range(sym, key, lookback_days, POLY_10M_URL, cache_tag="10m")
 
 
 def _coerce_ts_to_sec(t: Any) -> int:
@@ -249,66 +320,55 @@ def fetch_backend2_10m(sym: str, tf: str = "10m", limit: int = 1200, lookback_da
     return out
 
 
-def build_4h_from_1h(bars1h: List[dict]) -> List[dict]:
+def _group_4h(bars: List[dict]) -> List[dict]:
     """
-    Build synthetic 4H candles from Polygon 1H candles.
-    Current grouping is UTC buckets: 00:00/04:00/08:00/12:00/16:00/20:00 UTC.
+    Group time-sorted bars into UTC 4H buckets (00/04/08/12/16/20) with a single streaming fold.
+    Every fetcher returns bars sorted by time, so a bucket is complete as soon as the key changes.
     """
-    if not bars1h:
-        return []
-
-    buckets: dict[int, List[dict]] = {}
-
-    for b in bars1h:
-        k = int(b["time"]) // (4 * 3600)
-        buckets.setdefault(k, []).append(b)
-
+    step = 4 * 3600
     out: List[dict] = []
-
-    for k in sorted(buckets.keys()):
-        grp = buckets[k]
-        grp.sort(key=lambda x: x["time"])
-        out.append(
-            {
-                "time": int(grp[0]["time"]),
-                "open": float(grp[0]["open"]),
-                "high": float(max(x["high"] for x in grp)),
-                "low": float(min(x["low"] for x in grp)),
-                "close": float(grp[-1]["close"]),
-                "volume": float(sum(x.get("volume", 0.0) for x in grp)),
-                "sourceBars": int(len(grp)),
+    cur_k: Optional[int] = None
+    g: dict = {}
+
+    for b in bars:
+        t = int(b["time"])
+        k = t // step
+
+        if k != cur_k:
+            cur_k = k
+            g = {
+                "time": t,
+                "open": float(b["open"]),
+                "high": float(b["high"]),
+                "low": float(b["low"]),
+                "close": float(b["close"]),
+                "volume": float(b.get("volume", 0.0)),
+                "sourceBars": 1,
             }
-        )
-
-    return out
+            out.append(g)
+            continue
 
+        if b["high"] > g["high"]:
+            g["high"] = float(b["high"])
+        if b["low"] < g["low"]:
+            g["low"] = float(b["low"])
+        g["close"] = float(b["close"])
+        g["volume"] += b.get("volume", 0.0)
+        g["sourceBars"] += 1
 
-def build_4h_from_10m(bars10: List[dict], keep_live: bool = False) -> List[dict]:
-    if not bars10:
-        return []
+    return out
 
-    buckets: dict[int, List[dict]] = {}
 
-    for b in bars10:
-        k = int(b["time"]) // (4 * 3600)
-        buckets.setdefault(k, []).append(b)
+def build_4h_from_1h(bars1h: List[dict]) -> List[dict]:
+    """
+    Build synthetic 4H candles from Polygon 1H candles.
+    Current grouping is UTC buckets: 00:00/04:00/08:00/12:00/16:00/20:00 UTC.
+    """
+    return _group_4h(bars1h)
 
-    out: List[dict] = []
 
-    for k in sorted(buckets.keys()):
-        grp = buckets[k]
-        grp.sort(key=lambda x: x["time"])
-        out.append(
-            {
-                "time": int(grp[0]["time"]),
-                "open": float(grp[0]["open"]),
-                "high": float(max(x["high"] for x in grp)),
-                "low": float(min(x["low"] for x in grp)),
-                "close": float(grp[-1]["close"]),
-                "volume": float(sum(x.get("volume", 0.0) for x in grp)),
-                "sourceBars": int(len(grp)),
-            }
-        )
+def build_4h_from_10m(bars10: List[dict], keep_live: bool = False) -> List[dict]:
+    out = _group_4h(bars10)
 
     if out and not keep_live:
         now_ts = int(time.time())
@@ -319,26 +379,45 @@ def build_4h_from_10m(bars10: List[dict], keep_live: bool = False) -> List[dict]
     return out
 
 
-def ema_series(vals: List[float], span: int) -> List[float]:
-    k = 2.0 / (span + 1.0)
-    out: List[float] = []
-    e: Optional[float] = None
+def structure_tails(
+    H: List[float],
+    L: List[float],
+    C: List[float],
+    V: List[float],
+) -> Tuple[float, float, float, float, float, float, float]:
+    """
+    One pass over the active 4H bars, returning the last value of each EMA used downstream:
+      (ema10, ema20, ema50, ema200 of close, ema3, ema12 of volume, ema3 of true range)
+    Every EMA is seeded with its first input, same as a full-series EMA.
+    """
+    k10, k20, k50, k200 = 2.0 / 11.0, 2.0 / 21.0, 2.0 / 51.0, 2.0 / 201.0
+    kv3, kv12, ka3 = 2.0 / 4.0, 2.0 / 13.0, 2.0 / 4.0
 
-    for v in vals:
-        e = float(v) if e is None else e + k * (float(v) - e)
-        out.append(e)
+    e10 = e20 = e50 = e200 = float(C[0])
+    v3 = v12 = float(V[0])
+    atr3 = 0.0
 
-    return out
+    for i in range(1, len(C)):
+        c = float(C[i])
+        e10 += k10 * (c - e10)
+        e20 += k20 * (c - e20)
+        e50 += k50 * (c - e50)
+        e200 += k200 * (c - e200)
 
+        v = float(V[i])
+        v3 += kv3 * (v - v3)
+        v12 += kv12 * (v - v12)
 
-def ema_last(vals: List[float], span: int) -> Optional[float]:
-    if not vals:
-        return None
-    return ema_series(vals, span)[-1]
+        pc = C[i - 1]
+        tr = max(H[i] - L[i], abs(H[i] - pc), abs(L[i] - pc))
+        atr3 = tr if i == 1 else atr3 + ka3 * (tr - atr3)
 
+    return e10, e20, e50, e200, v3, v12, atr3
 
-def tr_series(H: List[float], L: List[float], C: List[float]) -> List[float]:
-    return [max(H[i] - L[i], abs(H[i] - C[i - 1]), abs(L[i] - C[i - 1])) for i in range(1, len(C))]
+
+def tr_series(H: List[float], L: List[float], C: List[float], start: int = 1) -> List[float]:
+    """True range for bars[start:]; pass a later start when only the tail is needed."""
+    return [max(H[i] - L[i], abs(H[i] - C[i - 1]), abs(L[i] - C[i - 1])) for i in range(max(1, start), len(C))]
 
 
 def lux_psi_stateful(closes: List[float], conv: int = 50, length: int = 20) -> Optional[float]:
@@ -347,25 +426,27 @@ def lux_psi_stateful(closes: List[float], conv: int = 50, length: int = 20) -> O
 
     mx = 0.0
     mn = 0.0
-    diffs: List[float] = []
+    win: List[float] = []
     eps = 1e-12
-
-    for src in map(float, closes):
-        mx = max(src, mx - (mx - src) / conv)
-        mn = min(src, mn + (src - mn) / conv)
-        span = max(mx - mn, eps)
-        diffs.append(math.log(span))
-
-    win = diffs[-length:]
-    if len(win) < length:
-        return None
-
-    xs = list(range(length))
-    xbar = sum(xs) / length
+    log = math.log
+
+    # The envelope must run over every close, but only the last `length`
+    # log-spans feed the correlation, so log() is taken on those alone.
+    tail_start = len(closes) - length
+
+    for i, src in enumerate(map(float, closes)):
+        up = mx - (mx - src) / conv
+        mx = up if up > src else src
+        dn = mn + (src - mn) / conv
+        mn = dn if dn < src else src
+        if i >= tail_start:
+            span = mx - mn
+            win.append(log(span if span > eps else eps))
+
+    dxs, denx = psi_x_terms(length)
     ybar = sum(win) / length
 
-    num = sum((x - xbar) * (y - ybar) for x, y in zip(xs, win))
-    denx = sum((x - xbar) ** 2 for x in xs)
+    num = sum(dx * (y - ybar) for dx, y in zip(dxs, win))
     deny = sum((y - ybar) ** 2 for y in win)
     den = math.sqrt(denx * deny) if denx > 0 and deny > 0 else 0.0
 
@@ -374,64 +455,67 @@ def lux_psi_stateful(closes: List[float], conv: int = 50, length: int = 20) -> O
     return float(clamp(psi, 0.0, 100.0))
 
 
-def tv_smi_and_signal(
+def tv_smi_last(
     H: List[float],
     L: List[float],
     C: List[float],
     lengthK: int,
     lengthD: int,
     lengthEMA: int,
-) -> Tuple[List[float], List[float]]:
+) -> Tuple[Optional[float], Optional[float]]:
+    """
+    TradingView-style SMI and its signal EMA, returning only the last (smi, signal) pair.
+    Returns (None, None) when there are not enough bars.
+    """
     n = len(C)
 
     if n < max(lengthK, lengthD, lengthEMA) + 5:
-        return [], []
+        return None, None
 
-    HH: List[float] = []
-    LL: List[float] = []
-
-    for i in range(n):
-        i0 = max(0, i - (lengthK - 1))
-        HH.append(max(H[i0:i + 1]))
-        LL.append(min(L[i0:i + 1]))
+    # Double EMA of rel/rangeHL and the signal EMA, fused into one pass.
+    kd = 2.0 / (lengthD + 1.0)
+    ks = 2.0 / (lengthEMA + 1.0)
 
-    rangeHL = [HH[i] - LL[i] for i in range(n)]
-    rel = [C[i] - (HH[i] + LL[i]) / 2.0 for i in range(n)]
+    n1 = n2 = d1 = d2 = 0.0
+    smi = sig = 0.0
 
-    def ema_ema(vals: List[float], length: int) -> List[float]:
-        e1 = ema_series(vals, length)
-        e2 = ema_series(e1, length)
-        return e2
-
-    nume = ema_ema(rel, lengthD)
-    deno = ema_ema(rangeHL, lengthD)
-
-    smi: List[float] = []
+    # Monotonic deques of bar indices for the rolling lengthK high/low.
+    dq_h: deque = deque()
+    dq_l: deque = deque()
 
     for i in range(n):
-        d = deno[i]
-        smi.append(0.0 if d == 0 else 200.0 * (nume[i] / d))
-
-    sig = ema_series(smi, lengthEMA)
-    return smi, sig
-
-
-def smi_to_pct(smi_val: float) -> float:
-    return clamp(50.0 + 0.5 * float(smi_val), 0.0, 100.0)
-
-
-def posture_from_dist(dist_pct: float, full_dist: float) -> float:
-    unit = clamp(dist_pct / max(full_dist, 1e-9), -1.0, 1.0)
-    return clamp(50.0 + 50.0 * unit, 0.0, 100.0)
-
-
-def score_vol(vol_scaled: float) -> float:
-    return clamp(100.0 - clamp(vol_scaled, 0.0, 100.0), 0.0, 100.0)
+        i0 = i - (lengthK - 1)
+
+        while dq_h and H[dq_h[-1]] <= H[i]:
+            dq_h.pop()
+        dq_h.append(i)
+        if dq_h[0] < i0:
+            dq_h.popleft()
+
+        while dq_l and L[dq_l[-1]] >= L[i]:
+            dq_l.pop()
+        dq_l.append(i)
+        if dq_l[0] < i0:
+            dq_l.popleft()
+
+        hh = H[dq_h[0]]
+        ll = L[dq_l[0]]
+        range_hl = hh - ll
+        rel = C[i] - (hh + ll) / 2.0
+
+        if i == 0:
+            n1 = n2 = rel
+            d1 = d2 = range_hl
+        else:
+            n1 += kd * (rel - n1)
+            n2 += kd * (n1 - n2)
+            d1 += kd * (range_hl - d1)
+            d2 += kd * (d1 - d2)
 
+        smi = 0.0 if d2 == 0 else 200.0 * (n2 / d2)
+        sig = smi if i == 0 else sig + ks * (smi - sig)
 
-def score_liq(liq: float) -> float:
-    liq_c = clamp(liq, 0.0, 120.0)
-    return (liq_c / 120.0) * 100.0
+    return smi, sig
 
 
 def apply_structure_soft_cap(
@@ -487,8 +571,8 @@ def compute_overall_weighted(
     above50: bool,
     above200: bool,
 ) -> Tuple[str, float, dict]:
-    liq_norm = score_liq(liquidity_val)
-    vol_sc = score_vol(vol_scaled)
+    liq_norm = (max(0.0, min(120.0, liquidity_val)) / 120.0) * 100.0
+    vol_sc = 100.0 - max(0.0, min(100.0, vol_scaled))
 
     bonus = 0.0
     if smi_bonus_pts > 0:
@@ -530,7 +614,7 @@ def _psi_from_bars(bars: List[dict]) -> Optional[float]:
     if len(bars) < 25:
         return None
     closes = [float(b["close"]) for b in bars]
-    return lux_psi_stateful(closes, conv=50, length=20)
+    return lux_psi_stateful(closes, conv=PSI_CONV_4H, length=PSI_LEN_4H)
 
 
 def build_active_squeeze_4h(
@@ -551,8 +635,10 @@ def build_active_squeeze_4h(
         return raw, "RAW_ONLY_INSUFFICIENT_BARS", {"rawPsi": round(raw, 2)}
 
     price = float(C[-1])
-    rng = [max(float(H[i]) - float(L[i]), 0.0) for i in range(len(C))]
-    trs = tr_series(H, L, C)
+    # Only the 3- and 20-bar averages are read, so build just the last 20 ranges/TRs.
+    tail0 = len(C) - 20
+    rng = [max(float(H[i]) - float(L[i]), 0.0) for i in range(tail0, len(C))]
+    trs = tr_series(H, L, C, start=tail0)
 
     range3 = avg_last(rng, 3) or 0.0
     range20 = avg_last(rng, 20) or 0.0
@@ -634,6 +720,7 @@ def main() -> None:
     args = ap.parse_args()
 
     key = os.environ.get("POLYGON_API_KEY") or os.environ.get("POLY_API_KEY") or os.environ.get("POLY_KEY") or ""
+    BAR_CACHE.update(load_bar_cache(BAR_CACHE_PATH))
 
     try:
         with open(args.source, "r", encoding="utf-8") as f:
@@ -644,66 +731,84 @@ def main() -> None:
 
     cards = src.get("sectorCards") or []
 
+    # One pass over the cards: breadth/momentum counts, risk-on tally, and sector direction.
     NH = NL = UP = DN = 0.0
+    rising_good = 0
+    rising_total = 0
+    # Last card per sector wins; a non-numeric breadth withdraws that sector's vote.
+    votes: dict = {}
+
     for c in cards:
         NH += float(c.get("nh", 0))
         NL += float(c.get("nl", 0))
         UP += float(c.get("up", 0))
         DN += float(c.get("down", 0))
 
-    breadth_4h = round(pct(NH, NH + NL), 2) if (NH + NL) > 0 else 50.0
-    momentum_4h_legacy = round(pct(UP, UP + DN), 2) if (UP + DN) > 0 else 50.0
+        bp = c.get("breadth_pct")
+        mp = c.get("momentum_pct")
+        bp_ok = isinstance(bp, (int, float))
 
-    by = {(c.get("sector") or "").strip().lower(): c for c in cards}
-    ro_score = ro_den = 0
+        sec = (c.get("sector") or "").strip().lower()
+        side = SECTOR_SIDE.get(sec)
+        if side is not None:
+            if bp_ok:
+                votes[sec] = 1 if (float(bp) >= 55.0 if side > 0 else float(bp) <= 45.0) else 0
+            else:
+                votes[sec] = None
 
-    for s in OFFENSIVE:
-        bp = by.get(s, {}).get("breadth_pct")
-        if isinstance(bp, (int, float)):
-            ro_den += 1
-            if float(bp) >= 55.0:
-                ro_score += 1
+        if bp_ok and isinstance(mp, (int, float)):
+            rising_total += 1
+            if float(bp) >= 55.0 and float(mp) >= 55.0:
+                rising_good += 1
 
-    for s in DEFENSIVE:
-        bp = by.get(s, {}).get("breadth_pct")
-        if isinstance(bp, (int, float)):
+    ro_score = ro_den = 0
+    for v in votes.values():
+        if v is not None:
             ro_den += 1
-            if float(bp) <= 45.0:
-                ro_score += 1
+            ro_score += v
+
+    breadth_4h = round(pct(NH, NH + NL), 2) if (NH + NL) > 0 else 50.0
+    momentum_4h_legacy = round(pct(UP, UP + DN), 2) if (UP + DN) > 0 else 50.0
 
     risk_on_4h = round(pct(ro_score, ro_den), 2) if ro_den > 0 else 50.0
 
-    # --- Native/reference 4H source ---
-    spy_4h_native = fetch_polygon_4h("SPY", key, lookback_days=FETCH_DAYS_4H, keep_live=True)
-    native_source_used = "polygon_240m"
+    # The Polygon 10m/60m debug pulls and the Backend-2 1H structure pull do not depend
+    # on the native 4H result, so they run in the background while the native chain resolves.
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        f_poly_10m = ex.submit(fetch_polygon_10m, "SPY", key, FETCH_DAYS_4H)
+        f_poly_1h = ex.submit(fetch_polygon_1h, "SPY", key, FETCH_DAYS_4H)
+        f_b2_1h = ex.submit(fetch_backend2_10m, "SPY", "1h", B2_LIMIT, FETCH_DAYS_4H)
 
-    if len(spy_4h_native) < 25:
-        print("[warn] insufficient Polygon 240m bars; falling back to Backend-2 10m aggregation", flush=True)
-        spy_10m = fetch_backend2_10m("SPY", tf=B2_TF, limit=B2_LIMIT, lookback_days=FETCH_DAYS_4H)
-        spy_4h_native = build_4h_from_10m(spy_10m, keep_live=True)
-        native_source_used = "backend2_10m_grouped_4h"
+        # --- Native/reference 4H source ---
+        spy_4h_native = fetch_polygon_4h("SPY", key, lookback_days=FETCH_DAYS_4H, keep_live=True)
+        native_source_used = "polygon_240m"
 
-    if len(spy_4h_native) < 25:
-        print("[warn] insufficient Backend-2 10m bars; falling back to Polygon 10m aggregation", flush=True)
-        poly_10m = fetch_polygon_10m("SPY", key, lookback_days=FETCH_DAYS_4H)
-        spy_4h_native = build_4h_from_10m(poly_10m, keep_live=True)
-        native_source_used = "polygon_10m_grouped_4h"
+        if len(spy_4h_native) < 25:
+            print("[warn] insufficient Polygon 240m bars; falling back to Backend-2 10m aggregation", flush=True)
+            spy_10m = fetch_backend2_10m("SPY", tf=B2_TF, limit=B2_LIMIT, lookback_days=FETCH_DAYS_4H)
+            spy_4h_native = build_4h_from_10m(spy_10m, keep_live=True)
+            native_source_used = "backend2_10m_grouped_4h"
 
-    if len(spy_4h_native) < 25:
-        print("[fatal] insufficient SPY 4H bars even after all fallbacks", file=sys.stderr)
-        sys.exit(2)
+        if len(spy_4h_native) < 25:
+            print("[warn] insufficient Backend-2 10m bars; falling back to Polygon 10m aggregation", flush=True)
+            spy_4h_native = build_4h_from_10m(f_poly_10m.result(), keep_live=True)
+            native_source_used = "polygon_10m_grouped_4h"
+
+        if len(spy_4h_native) < 25:
+            print("[fatal] insufficient SPY 4H bars even after all fallbacks", file=sys.stderr)
+            sys.exit(2)
+
+        spy_10m_test = f_poly_10m.result()
+        spy_1h_test = f_poly_1h.result()
+        backend2_1h_bars = f_b2_1h.result()
 
     # --- Debug / alternate 4H sources ---
-    spy_10m_test = fetch_polygon_10m("SPY", key, lookback_days=FETCH_DAYS_4H)
     spy_4h_from_10m = build_4h_from_10m(spy_10m_test, keep_live=True)
-
-    spy_1h_test = fetch_polygon_1h("SPY", key, lookback_days=FETCH_DAYS_4H)
     spy_4h_from_1h = build_4h_from_1h(spy_1h_test)
 
      # --- Active 4H structure source ---
     # Backend-2 1H is the confirmed live SPY source near real chart price.
     # Polygon 60m/240m remains debug/reference only because it produced stale/bad SPY pricing.
-    backend2_1h_bars = fetch_backend2_10m("SPY", tf="1h", limit=B2_LIMIT, lookback_days=FETCH_DAYS_4H)
     backend2_1h_4h = build_4h_from_1h(backend2_1h_bars)
 
     if len(backend2_1h_4h) >= STRUCTURE_MIN_1H_BUILT_BARS:
@@ -718,20 +823,16 @@ def main() -> None:
 
     source_used = structure_source_4h
 
-    O = [float(b["open"]) for b in spy_4h_structure]
-    H = [float(b["high"]) for b in spy_4h_structure]
-    L = [float(b["low"]) for b in spy_4h_structure]
-    C = [float(b["close"]) for b in spy_4h_structure]
-    V = [float(b["volume"]) for b in spy_4h_structure]
+    # One transposition pass: bar dicts -> O/H/L/C/V columns (every source already yields floats).
+    O, H, L, C, V = map(list, zip(*map(itemgetter("open", "high", "low", "close", "volume"), spy_4h_structure)))
 
     if len(C) < 25:
         print("[fatal] insufficient active SPY 4H structure bars", file=sys.stderr)
         sys.exit(2)
 
-    e10 = ema_series(C, 10)[-1]
-    e20 = ema_series(C, 20)[-1]
-    e50 = ema_series(C, 50)[-1]
-    e200 = ema_series(C, 200)[-1] if len(C) >= 200 else None
+    e10, e20, e50, e200, v3, v12, atr3 = structure_tails(H, L, C, V)
+    if len(C) < 200:
+        e200 = None
 
     price = float(C[-1])
     above10 = price > e10
@@ -759,17 +860,19 @@ def main() -> None:
     else:
         ema_sign = 0
 
-    ema10_posture = posture_from_dist(ema_dist_pct, FULL_EMA_DIST)
+    ema10_unit = max(-1.0, min(1.0, ema_dist_pct / max(FULL_EMA_DIST, 1e-9)))
+    ema10_posture = max(0.0, min(100.0, 50.0 + 50.0 * ema10_unit))
 
-    smi_series, sig_series = tv_smi_and_signal(H, L, C, SMI_K_LEN, SMI_D_LEN, SMI_EMA_LEN)
-    smi_val = float(smi_series[-1]) if smi_series else 0.0
-    sig_val = float(sig_series[-1]) if sig_series else 0.0
-    smi_pct = smi_to_pct(smi_val)
+    smi_last, sig_last = tv_smi_last(H, L, C, SMI_K_LEN, SMI_D_LEN, SMI_EMA_LEN)
+    has_smi = smi_last is not None and sig_last is not None
+    smi_val = float(smi_last) if has_smi else 0.0
+    sig_val = float(sig_last) if has_smi else 0.0
+    smi_pct = max(0.0, min(100.0, 50.0 + 0.5 * smi_val))
 
     momentum_combo_4h = round(clamp(W_EMA_POSTURE * ema10_posture + W_SMI_4H * smi_pct, 0.0, 100.0), 2)
 
     smi_bonus = 0
-    if smi_series and sig_series:
+    if has_smi:
         if smi_val > sig_val:
             smi_bonus = +SMI_BONUS_MAX
         elif smi_val < sig_val:
@@ -816,26 +919,11 @@ def main() -> None:
     squeeze_psi_4h = float(clamp(squeeze_psi_4h, 0.0, 100.0))
     squeeze_exp_4h = clamp(100.0 - squeeze_psi_4h, 0.0, 100.0)
 
-    v3 = ema_last(V, 3)
-    v12 = ema_last(V, 12)
     liquidity_4h = 0.0 if not v12 or v12 <= 0 else clamp(100.0 * (v3 / v12), 0.0, 200.0)
 
-    trs = tr_series(H, L, C)
-    atr3 = ema_last(trs, 3) if trs else None
     vol_pct = 0.0 if not atr3 or C[-1] <= 0 else max(0.0, 100.0 * atr3 / C[-1])
     vol_scaled = round(vol_pct * 6.25, 2)
 
-    rising_good = 0
-    rising_total = 0
-
-    for c in cards:
-        bp = c.get("breadth_pct")
-        mp = c.get("momentum_pct")
-        if isinstance(bp, (int, float)) and isinstance(mp, (int, float)):
-            rising_total += 1
-            if float(bp) >= 55.0 and float(mp) >= 55.0:
-                rising_good += 1
-
     sector_dir_4h = round(pct(rising_good, rising_total), 2) if rising_total > 0 else 50.0
 
     state, score, comps = compute_overall_weighted(
@@ -872,7 +960,7 @@ def main() -> None:
             timing_penalty += 6.0
             timing_reasons.append("PRICE_BELOW_4H_EMA10")
 
-    if smi_series and sig_series and smi_val < sig_val:
+    if has_smi and smi_val < sig_val:
         if above20 and above50:
             timing_penalty += 3.0
             timing_reasons.append("SMI_4H_COOLING_BRIDGE_STILL_ALIVE")
@@ -1028,10 +1116,9 @@ def main() -> None:
         },
     }
 
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    write_json_atomic(args.out, out, ensure_ascii=False, separators=(",", ":"))
 
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, separators=(",", ":"))
+    save_bar_cache(BAR_CACHE_PATH, BAR_CACHE)
 
     print(
         f"[4h] score={score:.2f} state={state} source={source_used} bars={len(spy_4h_structure)} "
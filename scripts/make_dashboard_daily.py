@@ -23,10 +23,23 @@ import math
 import os
 import sys
 import time
-import urllib.request
-from datetime import datetime, timedelta, timezone
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from operator import itemgetter
 from typing import List, Optional, Tuple, Dict
 
+from _signals_utils import (
+    cache_agrees,
+    keepalive_get,
+    load_bar_cache,
+    psi_x_terms,
+    save_bar_cache,
+    window_cache_entry,
+    window_cache_rows,
+    write_json_atomic,
+)
+
 UTC = timezone.utc
 
 POLY_BASE = "https://api.polygon.io"
@@ -39,6 +52,8 @@ SECTOR_ETFS = ["XLK", "XLY", "XLC", "XLP", "XLU", "XLV", "XLRE", "XLE", "XLF", "
 
 OFFENSIVE = {"information technology", "consumer discretionary", "communication services", "industrials"}
 DEFENSIVE = {"consumer staples", "utilities", "health care", "real estate"}
+# risk-on vote side per sector: +1 offensive (wants breadth > 50), -1 defensive (wants breadth < 50)
+SECTOR_SIDE = {**{s: 1 for s in OFFENSIVE}, **{s: -1 for s in DEFENSIVE}}
 
 # --- EOD structure thresholds ---
 EMA10_PULLBACK_TOL = -0.20  # kept for diagnostics / minor modifier use
@@ -59,6 +74,11 @@ PSI_WIN_D = int(os.environ.get("PSI_WIN_D", "10"))
 # Increased SPY default to stabilize EMA200. Still configurable.
 FETCH_DAYS_SPY = int(os.environ.get("FETCH_DAYS_SPY", "420"))
 FETCH_DAYS_SECTORS = int(os.environ.get("FETCH_DAYS_SECTORS", "120"))
+SECTOR_FETCH_WORKERS = int(os.environ.get("SECTOR_FETCH_WORKERS", "5"))
+
+# --- optional daily bar cache (closed sessions never change; fetch only the tail) ---
+BAR_CACHE_PATH = os.environ.get("BAR_CACHE_DAILY", "")
+BAR_CACHE: dict = {}
 
 # --- internals weak thresholds (LOCKED) ---
 INTERNALS_RED_COUNT = int(os.environ.get("INTERNALS_RED_COUNT", "7"))
@@ -71,38 +91,37 @@ def now_utc_iso() -> str:
 
 
 def clamp(x: float, lo: float, hi: float) -> float:
-    try:
-        return max(lo, min(hi, float(x)))
-    except Exception:
-        return lo
+    return max(lo, min(hi, float(x)))
 
 
 def pct(a: float, b: float) -> float:
     return 0.0 if b <= 0 else 100.0 * float(a) / float(b)
 
 
-def fetch_json(url: str, timeout: int = 30) -> dict:
-    req = urllib.request.Request(url, headers={"User-Agent": "make-eod/3.0", "Cache-Control": "no-store"})
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+_HTTP_HEADERS = {"User-Agent": "make-eod/3.0", "Cache-Control": "no-store"}
 
 
-def poly_daily_bars(ticker: str, days: int) -> List[dict]:
-    key = os.environ.get("POLYGON_API_KEY") or os.environ.get("POLY_API_KEY") or os.environ.get("POLY_KEY") or ""
-    if not key:
-        raise RuntimeError("Missing POLYGON_API_KEY in env/secrets.")
+def fetch_json(url: str, timeout: int = 30) -> dict:
+    return json.loads(keepalive_get(url, _HTTP_HEADERS, timeout))
 
-    end = datetime.now(UTC).date()
-    start = (end - timedelta(days=days)).strftime("%Y-%m-%d")
-    end_s = end.strftime("%Y-%m-%d")
 
-    url = POLY_URL_DAY.format(sym=ticker, start=start, end=end_s, key=key)
+def _parse_day_rows(rows: List[dict]) -> List[dict]:
+    # Fast path; the forgiving per-row parse below only runs for a malformed row.
     try:
-        js = fetch_json(url, timeout=25)
-    except Exception:
-        return []
+        return [
+            {
+                "t": int(r["t"]) // 1000,
+                "o": float(r["o"]),
+                "h": float(r["h"]),
+                "l": float(r["l"]),
+                "c": float(r["c"]),
+                "v": float(r["v"]),
+            }
+            for r in rows
+        ]
+    except (KeyError, TypeError, ValueError, OverflowError):
+        pass
 
-    rows = js.get("results") or []
     out: List[dict] = []
     for r in rows:
         try:
@@ -121,16 +140,88 @@ def poly_daily_bars(ticker: str, days: int) -> List[dict]:
     return out
 
 
-def ema_series(vals: List[float], span: int) -> List[float]:
-    k = 2.0 / (span + 1.0)
-    out: List[float] = []
-    e: Optional[float] = None
-    for v in vals:
-        e = v if e is None else e + k * (v - e)
-        out.append(e)
+def _poly_day_range(ticker: str, start: date, end: date, key: str) -> Optional[List[dict]]:
+    """Parsed daily rows for [start, end], or None when the request failed."""
+    url = POLY_URL_DAY.format(sym=ticker, start=start.strftime("%Y-%m-%d"), end=end.strftime("%Y-%m-%d"), key=key)
+    for attempt in range(1, 5):
+        try:
+            js = fetch_json(url, timeout=25)
+            break
+        except urllib.error.HTTPError as e:
+            if e.code == 429 and attempt < 4:
+                time.sleep(0.35 * (1.6 ** (attempt - 1)))
+                continue
+            return None
+        except Exception:
+            return None
+    return _parse_day_rows(js.get("results") or [])
+
+
+def poly_daily_bars(ticker: str, days: int) -> List[dict]:
+    """
+    Daily aggregates for the last `days` calendar days.
+    With a BAR_CACHE_DAILY file, only the tail from the last cached session is requested
+    and merged over the cached rows ([t, o, h, l, c, v]). The whole window is refetched
+    when the cache does not reach back to the window start or the overlap bar moved.
+    """
+    key = os.environ.get("POLYGON_API_KEY") or os.environ.get("POLY_API_KEY") or os.environ.get("POLY_KEY") or ""
+    if not key:
+        raise RuntimeError("Missing POLYGON_API_KEY in env/secrets.")
+
+    end = datetime.now(UTC).date()
+    start_d = end - timedelta(days=days)
+    cutoff = int(datetime(start_d.year, start_d.month, start_d.day, tzinfo=UTC).timestamp())
+
+    cached = window_cache_rows(BAR_CACHE, ticker, cutoff) if BAR_CACHE_PATH else []
+
+    out: Optional[List[dict]] = None
+    if cached:
+        # refetch the last cached session too: it may have been a partial bar
+        tail_start = max(start_d, datetime.fromtimestamp(cached[-1][0], UTC).date())
+        fresh = _poly_day_range(ticker, tail_start, end, key)
+        if fresh is None:
+            return []
+        if cache_agrees(cached, {b["t"]: b["c"] for b in fresh}):
+            merged: Dict[int, dict] = {
+                r[0]: {"t": r[0], "o": r[1], "h": r[2], "l": r[3], "c": r[4], "v": r[5]} for r in cached
+            }
+            merged.update((b["t"], b) for b in fresh)
+            out = sorted(merged.values(), key=itemgetter("t"))
+
+    if out is None:
+        out = _poly_day_range(ticker, start_d, end, key)
+        if out is None:
+            return []
+
+    if BAR_CACHE_PATH:
+        BAR_CACHE[ticker] = window_cache_entry(cutoff, [[b["t"], b["o"], b["h"], b["l"], b["c"], b["v"]] for b in out])
+
     return out
 
 
+def ema_last(vals: List[float], span: int) -> float:
+    # Callers only read the final EMA value; keep a scalar accumulator, no series.
+    k = 2.0 / (span + 1.0)
+    it = iter(vals)
+    e = next(it)
+    for v in it:
+        e += k * (v - e)
+    return e
+
+
+def ema_stack_last(vals: List[float]) -> Tuple[float, float, float, float]:
+    """Final EMA10/20/50/200 of `vals` from one pass (same recurrence as ema_last)."""
+    k10, k20, k50, k200 = (2.0 / (n + 1.0) for n in (10, 20, 50, 200))
+    it = iter(vals)
+    e10 = e20 = e50 = e200 = next(it)
+    for v in it:
+        e10 += k10 * (v - e10)
+        e20 += k20 * (v - e20)
+        e50 += k50 * (v - e50)
+        e200 += k200 * (v - e200)
+    return e10, e20, e50, e200
+
+
 def dist_pct(close: float, ema: float) -> float:
     if ema <= 0:
         return 0.0
@@ -138,8 +229,9 @@ def dist_pct(close: float, ema: float) -> float:
 
 
 def posture_from_dist(distp: float, full_dist: float) -> float:
-    unit = clamp(distp / max(full_dist, 1e-9), -1.0, 1.0)
-    return clamp(50.0 + 50.0 * unit, 0.0, 100.0)
+    # unit is already bounded to [-1, 1], so the result needs no second clamp.
+    unit = max(-1.0, min(1.0, distp / max(full_dist, 1e-9)))
+    return 50.0 + 50.0 * unit
 
 
 def lux_psi_from_closes(closes: List[float], conv: int = 50, length: int = 20) -> Optional[float]:
@@ -153,28 +245,32 @@ def lux_psi_from_closes(closes: List[float], conv: int = 50, length: int = 20) -
     if not closes or len(closes) < length + 2:
         return None
 
-    mx = None
-    mn = None
-    diffs: List[float] = []
+    mx = mn = float(closes[0])
+    win: List[float] = []
     eps = 1e-12
-
-    for src in map(float, closes):
-        mx = src if mx is None else max(mx - (mx - src) / conv, src)
-        mn = src if mn is None else min(mn + (src - mn) / conv, src)
-        span = max(mx - mn, eps)
-        diffs.append(math.log(span))
-
-    win = diffs[-length:]
-    if len(win) < length:
-        return None
-
-    xs = list(range(length))
-    xbar = sum(xs) / length
+    log = math.log
+
+    # Only the last `length` log-spans feed the correlation.
+    tail_start = len(closes) - length
+
+    for i, src in enumerate(map(float, closes)):
+        if i:
+            up = mx - (mx - src) / conv
+            mx = up if up > src else src
+            dn = mn + (src - mn) / conv
+            mn = dn if dn < src else src
+        if i >= tail_start:
+            span = mx - mn
+            win.append(log(span if span > eps else eps))
+
+    dxs, denx = psi_x_terms(length)
     ybar = sum(win) / length
 
-    num = sum((x - xbar) * (y - ybar) for x, y in zip(xs, win))
-    denx = sum((x - xbar) ** 2 for x in xs)
-    deny = sum((y - ybar) ** 2 for y in win)
+    num = deny = 0.0
+    for dx, y in zip(dxs, win):
+        dy = y - ybar
+        num += dx * dy
+        deny += dy ** 2
     den = math.sqrt(denx * deny) if denx > 0 and deny > 0 else 0.0
 
     r = (num / den) if den != 0 else 0.0
@@ -185,10 +281,12 @@ def lux_psi_from_closes(closes: List[float], conv: int = 50, length: int = 20) -
 def volatility_atr14_pct(C: List[float], H: List[float], L: List[float]) -> float:
     if len(C) < 20:
         return 20.0
-    trs = [max(H[i] - L[i], abs(H[i] - C[i - 1]), abs(L[i] - C[i - 1])) for i in range(1, len(C))]
-    if len(trs) < 14:
-        return 20.0
-    atr = sum(trs[-14:]) / 14.0
+    # only the 14-bar ATR window is ever read, so build just those true ranges
+    n = len(C)
+    atr = sum(
+        max(H[i] - L[i], abs(H[i] - C[i - 1]), abs(L[i] - C[i - 1]))
+        for i in range(n - 14, n)
+    ) / 14.0
     return max(0.0, 100.0 * atr / C[-1]) if C[-1] > 0 else 0.0
 
 
@@ -224,22 +322,25 @@ def squeeze_score_from_regime(regime_key: str) -> float:
 
 def daily_breadth_participation_from_sector_etfs() -> Tuple[float, float]:
     good = align = barup = 0
-    for sym in SECTOR_ETFS:
-        b = poly_daily_bars(sym, days=FETCH_DAYS_SECTORS)
+
+    # 11 small requests: fetch them concurrently; poly_daily_bars backs off on 429.
+    with ThreadPoolExecutor(max_workers=SECTOR_FETCH_WORKERS) as ex:
+        sector_bars = list(ex.map(lambda s: poly_daily_bars(s, days=FETCH_DAYS_SECTORS), SECTOR_ETFS))
+
+    for b in sector_bars:
         if len(b) < 30:
             continue
-        closes = [x["c"] for x in b]
-        opens = [x["o"] for x in b]
-        e10 = ema_series(closes, 10)[-1]
-        e20 = ema_series(closes, 20)[-1]
+        # only the close column is walked; the bar-up test needs just the last bar
+        closes = list(map(itemgetter("c"), b))
+        e10 = ema_last(closes, 10)
+        e20 = ema_last(closes, 20)
         good += 1
         if e10 > e20:
             align += 1
-        if closes[-1] > opens[-1]:
+        last = b[-1]
+        if last["c"] > last["o"]:
             barup += 1
 
-        time.sleep(0.10)
-
     if good <= 0:
         return (50.0, 50.0)
 
@@ -347,18 +448,45 @@ def apply_eod_score_guardrails(
     return clamp(score, 0.0, 48.0)
 
 
-def sector_is_red(card: dict) -> bool:
-    try:
-        b = float(card.get("breadth_pct", 50.0))
-        m = float(card.get("momentum_pct", 50.0))
-    except Exception:
-        return False
-    return (b <= 45.0) and (m <= 45.0)
+def sector_card_tallies(cards: List[dict]) -> Tuple[int, float]:
+    """
+    One pass over sectorCards -> (red sector count, sectorCards risk-on %).
+    red: breadth_pct <= 45 and momentum_pct <= 45 (defaults 50; unparsable => not red).
+    risk-on: offensive sectors with breadth > 50 and defensive sectors with breadth < 50,
+    over the sectors that carry a numeric breadth (last card per sector wins).
+    """
+    if not cards:
+        return 0, 50.0
 
+    red = 0
+    votes: Dict[str, Optional[int]] = {}
+    for c in cards:
+        try:
+            if float(c.get("breadth_pct", 50.0)) <= 45.0 and float(c.get("momentum_pct", 50.0)) <= 45.0:
+                red += 1
+        except Exception:
+            pass
 
-def compute_internals_weak(cards: List[dict], participation_daily: float, breadth_daily: float) -> Tuple[bool, int, str]:
-    red = sum(1 for c in (cards or []) if sector_is_red(c))
+        sec = (c.get("sector") or "").strip().lower()
+        side = SECTOR_SIDE.get(sec)
+        if side is None:
+            continue
+        b_raw = c.get("breadth_pct")
+        if isinstance(b_raw, (int, float)):
+            b = float(b_raw)
+            votes[sec] = 1 if (b > 50.0 if side > 0 else b < 50.0) else 0
+        else:
+            votes[sec] = None
 
+    score = considered = 0
+    for v in votes.values():
+        if v is not None:
+            considered += 1
+            score += v
+    return red, round(pct(score, considered or 1), 2)
+
+
+def compute_internals_weak(red: int, participation_daily: float, breadth_daily: float) -> Tuple[bool, int, str]:
     if red >= INTERNALS_RED_COUNT:
         return True, red, f"INTERNALS WEAK: {red}/11 sectors red"
     if isinstance(participation_daily, (int, float)) and participation_daily < INTERNALS_PARTICIPATION_MIN:
@@ -368,24 +496,6 @@ def compute_internals_weak(cards: List[dict], participation_daily: float, breadt
     return False, red, ""
 
 
-def compute_sectorcards_risk_on(cards: List[dict]) -> float:
-    if not cards:
-        return 50.0
-    by = {(c.get("sector") or "").strip().lower(): c for c in cards}
-    score = considered = 0
-    for s in OFFENSIVE:
-        b = by.get(s, {}).get("breadth_pct")
-        if isinstance(b, (int, float)):
-            considered += 1
-            score += (1 if float(b) > 50.0 else 0)
-    for s in DEFENSIVE:
-        b = by.get(s, {}).get("breadth_pct")
-        if isinstance(b, (int, float)):
-            considered += 1
-            score += (1 if float(b) < 50.0 else 0)
-    return round(pct(score, considered or 1), 2)
-
-
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--source", required=True, help="data/outlook_source_daily.json (sectorCards)")
@@ -402,22 +512,24 @@ def main():
 
     cards = src.get("sectorCards") or []
 
-    # SPY daily bars
-    bars = poly_daily_bars("SPY", days=FETCH_DAYS_SPY)
-    if len(bars) < 220:
-        print("[fatal] insufficient SPY daily bars", file=sys.stderr)
-        sys.exit(2)
+    BAR_CACHE.update(load_bar_cache(BAR_CACHE_PATH))
+
+    # Sector ETF breadth only needs the network; let it run while SPY is fetched.
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        sector_future = ex.submit(daily_breadth_participation_from_sector_etfs)
 
-    C = [b["c"] for b in bars]
-    H = [b["h"] for b in bars]
-    L = [b["l"] for b in bars]
-    V = [b["v"] for b in bars]
+        # SPY daily bars
+        bars = poly_daily_bars("SPY", days=FETCH_DAYS_SPY)
+        if len(bars) < 220:
+            print("[fatal] insufficient SPY daily bars", file=sys.stderr)
+            sys.exit(2)
+
+        breadth_daily, participation_daily = sector_future.result()
+
+    C, H, L, V = map(list, zip(*map(itemgetter("c", "h", "l", "v"), bars)))
     close = float(C[-1])
 
-    e10 = ema_series(C, 10)[-1]
-    e20 = ema_series(C, 20)[-1]
-    e50 = ema_series(C, 50)[-1]
-    e200 = ema_series(C, 200)[-1]
+    e10, e20, e50, e200 = ema_stack_last(C)
 
     d10 = dist_pct(close, e10)
     d20 = dist_pct(close, e20)
@@ -439,16 +551,14 @@ def main():
     stack_score = compute_stack_score(close, e10, e20, e50, e200)
 
     # slower, structure-first blend
-    ema_structure = float(
-        clamp(
-            0.40 * stack_score
-            + 0.15 * ema10_post
-            + 0.20 * ema20_post
-            + 0.15 * ema50_post
-            + 0.10 * ema200_post,
-            0.0,
-            100.0,
-        )
+    ema_structure = clamp(
+        0.40 * stack_score
+        + 0.15 * ema10_post
+        + 0.20 * ema20_post
+        + 0.15 * ema50_post
+        + 0.10 * ema200_post,
+        0.0,
+        100.0,
     )
 
     state, state_label = compute_eod_state(close, e10, e20, e50, e200)
@@ -456,26 +566,27 @@ def main():
     # ---- Lux PSI (SHORT MEMORY) ----
     Cw = C[-PSI_WIN_D:] if len(C) > PSI_WIN_D else C
     psi = lux_psi_from_closes(Cw, conv=LUX_CONV, length=LUX_LEN)
-    psi = float(psi) if isinstance(psi, (int, float)) else 50.0
-    psi = float(clamp(psi, 0.0, 100.0))
+    # lux_psi_from_closes already returns a float clamped to 0..100 (or None)
+    if psi is None:
+        psi = 50.0
 
     regime_key, regime_color, no_entries, mode_label = squeeze_regime(psi)
     squeeze_score = squeeze_score_from_regime(regime_key)
 
     # conditions: vol + liquidity + squeeze regime score
-    vol_pct = float(volatility_atr14_pct(C, H, L))
-    vol_score = float(clamp(100.0 - clamp(vol_pct, 0.0, 200.0), 0.0, 100.0))
+    # both helpers return bounded floats (ATR% >= 0, liquidity 0..120): inline bounds only
+    vol_pct = volatility_atr14_pct(C, H, L)
+    vol_score = 100.0 - vol_pct if vol_pct < 100.0 else 0.0
 
-    liq_pct = float(liquidity_5_20(V))
-    liq_norm = float(clamp((liq_pct / 120.0) * 100.0, 0.0, 100.0))
+    liq_pct = liquidity_5_20(V)
+    liq_norm = (liq_pct / 120.0) * 100.0
 
-    conditions = float(clamp(0.40 * squeeze_score + 0.30 * liq_norm + 0.30 * vol_score, 0.0, 100.0))
+    conditions = clamp(0.40 * squeeze_score + 0.30 * liq_norm + 0.30 * vol_score, 0.0, 100.0)
 
-    breadth_daily, participation_daily = daily_breadth_participation_from_sector_etfs()
-    breadth_confirm = float(clamp(0.60 * breadth_daily + 0.40 * participation_daily, 0.0, 100.0))
+    breadth_confirm = clamp(0.60 * breadth_daily + 0.40 * participation_daily, 0.0, 100.0)
 
-    internals_weak, red_count, internals_reason = compute_internals_weak(cards, participation_daily, breadth_daily)
-    risk_on = compute_sectorcards_risk_on(cards)
+    red_sectors, risk_on = sector_card_tallies(cards)
+    internals_weak, red_count, internals_reason = compute_internals_weak(red_sectors, participation_daily, breadth_daily)
 
     score_raw = float(W_EMA_STRUCT * ema_structure + W_BREADTH_CONF * breadth_confirm + W_CONDITIONS * conditions)
     score = apply_eod_score_guardrails(
@@ -656,9 +767,9 @@ def main():
         }
     }
 
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, separators=(",", ":"))
+    write_json_atomic(args.out, out, ensure_ascii=False, separators=(",", ":"))
+
+    save_bar_cache(BAR_CACHE_PATH, BAR_CACHE)
 
     print(
         f"[eod] state={state} label={state_label} score={score:.1f} raw={score_raw:.1f} "
@@ -21,9 +21,14 @@ import os
 import sys
 import time
 import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from operator import itemgetter
 from typing import List, Optional, Tuple
 
+from _signals_utils import psi_x_terms, write_json_atomic
+
 UTC = timezone.utc
 
 HOURLY_URL_DEFAULT = "https://frye-market-backend-1.onrender.com/live/hourly"
@@ -40,6 +45,8 @@ POLY_4H_URL = (
 
 OFFENSIVE = {"information technology", "consumer discretionary", "communication services", "industrials"}
 DEFENSIVE = {"consumer staples", "utilities", "health care", "real estate"}
+# risk-on vote side per sector: +1 offensive (wants breadth >= 55), -1 defensive (wants breadth <= 45)
+SECTOR_SIDE = {**{s: 1 for s in OFFENSIVE}, **{s: -1 for s in DEFENSIVE}}
 
 FULL_EMA_DIST = 0.60
 
@@ -97,22 +104,27 @@ def fetch_json(url: str, timeout: int = 30) -> dict:
         },
     )
     with urllib.request.urlopen(req, timeout=timeout) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+        return json.loads(resp.read())
 
 
-def fetch_polygon_bars(url_tmpl: str, key: str, sym: str, lookback_days: int) -> List[dict]:
-    end = datetime.utcnow().date()
-    start = end - timedelta(days=lookback_days)
-    url = url_tmpl.format(sym=sym, start=start, end=end, key=key)
-
+def _parse_bar_rows(rows: List[dict]) -> List[dict]:
+    # Fast path; the forgiving per-row parse below only runs for a malformed row.
     try:
-        js = fetch_json(url, timeout=25)
-    except Exception:
-        return []
+        return [
+            {
+                "time": int(r["t"]) // 1000,
+                "open": float(r["o"]),
+                "high": float(r["h"]),
+                "low": float(r["l"]),
+                "close": float(r["c"]),
+                "volume": float(r["v"]),
+            }
+            for r in rows
+        ]
+    except (KeyError, TypeError, ValueError, OverflowError):
+        pass
 
-    rows = js.get("results") or []
     out: List[dict] = []
-
     for r in rows:
         try:
             out.append(
@@ -127,8 +139,22 @@ def fetch_polygon_bars(url_tmpl: str, key: str, sym: str, lookback_days: int) ->
             )
         except Exception:
             continue
+    return out
+
+
+def fetch_polygon_bars(url_tmpl: str, key: str, sym: str, lookback_days: int) -> List[dict]:
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=lookback_days)
+    url = url_tmpl.format(sym=sym, start=start, end=end, key=key)
+
+    try:
+        js = fetch_json(url, timeout=25)
+    except Exception:
+        return []
 
-    out.sort(key=lambda x: x["time"])
+    rows = js.get("results") or []
+    out = _parse_bar_rows(rows)
+    out.sort(key=itemgetter("time"))
 
     # Drop in-flight 1H/4H bucket if present.
     if out:
@@ -141,29 +167,44 @@ def fetch_polygon_bars(url_tmpl: str, key: str, sym: str, lookback_days: int) ->
     return out
 
 
-def ema_series(vals: List[float], span: int) -> List[float]:
-    k = 2.0 / (span + 1.0)
-    out: List[float] = []
-    e: Optional[float] = None
-
-    for v in vals:
-        e = float(v) if e is None else e + k * (float(v) - e)
-        out.append(e)
-
-    return out
-
-
 def ema_last(vals: List[float], span: int) -> Optional[float]:
+    # e += k * (v - e), seeded with the first value; only the final value is kept.
     if not vals:
         return None
-    return ema_series(vals, span)[-1]
+    k = 2.0 / (span + 1.0)
+    it = iter(vals)
+    e = float(next(it))
+    for v in it:
+        e += k * (v - e)
+    return e
 
 
-def tr_series(H: List[float], L: List[float], C: List[float]) -> List[float]:
-    return [
-        max(H[i] - L[i], abs(H[i] - C[i - 1]), abs(L[i] - C[i - 1]))
-        for i in range(1, len(C))
-    ]
+def ema_pair_last(vals: List[float], span_a: int, span_b: int) -> Tuple[Optional[float], Optional[float]]:
+    """Final EMAs of `vals` at two spans from one pass (same recurrence as ema_last)."""
+    if not vals:
+        return None, None
+    ka = 2.0 / (span_a + 1.0)
+    kb = 2.0 / (span_b + 1.0)
+    it = iter(vals)
+    ea = eb = float(next(it))
+    for v in it:
+        ea += ka * (v - ea)
+        eb += kb * (v - eb)
+    return ea, eb
+
+
+def atr_ema_last(H: List[float], L: List[float], C: List[float], span: int) -> Optional[float]:
+    # ema_last over the true-range series, with each TR folded in as it is computed.
+    n = len(C)
+    if n < 2:
+        return None
+    k = 2.0 / (span + 1.0)
+    e = None
+    for i in range(1, n):
+        pc = C[i - 1]
+        tr = max(H[i] - L[i], abs(H[i] - pc), abs(L[i] - pc))
+        e = float(tr) if e is None else e + k * (tr - e)
+    return e
 
 
 def lux_psi_stateful(closes: List[float], conv: int = 50, length: int = 20) -> Optional[float]:
@@ -183,33 +224,32 @@ def lux_psi_stateful(closes: List[float], conv: int = 50, length: int = 20) -> O
     if not closes or len(closes) < max(5, length + 2):
         return None
 
-    mx = None
-    mn = None
-    diffs: List[float] = []
+    mx = mn = float(closes[0])
+    win: List[float] = []
     eps = 1e-12
-
-    for src in map(float, closes):
-        if mx is None or mn is None:
-            mx = src
-            mn = src
-        else:
-            mx = max(src, mx - (mx - src) / conv)
-            mn = min(src, mn + (src - mn) / conv)
-
-        span = max(mx - mn, eps)
-        diffs.append(math.log(span))
-
-    win = diffs[-length:]
-    if len(win) < length:
-        return None
-
-    xs = list(range(length))
-    xbar = sum(xs) / length
+    log = math.log
+
+    # Only the last `length` log-spans feed the correlation.
+    tail_start = len(closes) - length
+
+    for i, src in enumerate(map(float, closes)):
+        if i:
+            up = mx - (mx - src) / conv
+            mx = up if up > src else src
+            dn = mn + (src - mn) / conv
+            mn = dn if dn < src else src
+        if i >= tail_start:
+            span = mx - mn
+            win.append(log(span if span > eps else eps))
+
+    dxs, denx = psi_x_terms(length)
     ybar = sum(win) / length
 
-    num = sum((x - xbar) * (y - ybar) for x, y in zip(xs, win))
-    denx = sum((x - xbar) ** 2 for x in xs)
-    deny = sum((y - ybar) ** 2 for y in win)
+    num = deny = 0.0
+    for dx, y in zip(dxs, win):
+        dy = y - ybar
+        num += dx * dy
+        deny += dy ** 2
     den = math.sqrt(denx * deny) if denx > 0 and deny > 0 else 0.0
 
     r = (num / den) if den != 0 else 0.0
@@ -218,44 +258,66 @@ def lux_psi_stateful(closes: List[float], conv: int = 50, length: int = 20) -> O
     return float(clamp(psi, 0.0, 100.0))
 
 
-def tv_smi_and_signal(
+def tv_smi_last(
     H: List[float],
     L: List[float],
     C: List[float],
     lengthK: int,
     lengthD: int,
     lengthEMA: int,
-) -> Tuple[List[float], List[float]]:
+) -> Tuple[Optional[float], Optional[float]]:
+    """
+    TradingView-style SMI and its signal EMA, returning only the last (smi, signal) pair.
+    Returns (None, None) when there are not enough bars.
+    """
     n = len(C)
 
     if n < max(lengthK, lengthD, lengthEMA) + 5:
-        return [], []
-
-    HH: List[float] = []
-    LL: List[float] = []
-
-    for i in range(n):
-        i0 = max(0, i - (lengthK - 1))
-        HH.append(max(H[i0:i + 1]))
-        LL.append(min(L[i0:i + 1]))
+        return None, None
 
-    rangeHL = [HH[i] - LL[i] for i in range(n)]
-    rel = [C[i] - (HH[i] + LL[i]) / 2.0 for i in range(n)]
+    # Double EMA of rel/rangeHL and the signal EMA, fused into one pass.
+    kd = 2.0 / (lengthD + 1.0)
+    ks = 2.0 / (lengthEMA + 1.0)
 
-    def ema_ema(vals: List[float], length: int) -> List[float]:
-        e1 = ema_series(vals, length)
-        e2 = ema_series(e1, length)
-        return e2
+    n1 = n2 = d1 = d2 = 0.0
+    smi = sig = 0.0
 
-    nume = ema_ema(rel, lengthD)
-    deno = ema_ema(rangeHL, lengthD)
+    # Monotonic deques of bar indices: rolling lengthK high/low in O(n), no per-bar slices.
+    dq_h: deque = deque()
+    dq_l: deque = deque()
 
-    smi: List[float] = []
     for i in range(n):
-        d = deno[i]
-        smi.append(0.0 if d == 0 else 200.0 * (nume[i] / d))
+        i0 = i - (lengthK - 1)
+
+        while dq_h and H[dq_h[-1]] <= H[i]:
+            dq_h.pop()
+        dq_h.append(i)
+        if dq_h[0] < i0:
+            dq_h.popleft()
+
+        while dq_l and L[dq_l[-1]] >= L[i]:
+            dq_l.pop()
+        dq_l.append(i)
+        if dq_l[0] < i0:
+            dq_l.popleft()
+
+        hh = H[dq_h[0]]
+        ll = L[dq_l[0]]
+        range_hl = hh - ll
+        rel = C[i] - (hh + ll) / 2.0
+
+        if i == 0:
+            n1 = n2 = float(rel)
+            d1 = d2 = float(range_hl)
+        else:
+            n1 += kd * (rel - n1)
+            n2 += kd * (n1 - n2)
+            d1 += kd * (range_hl - d1)
+            d2 += kd * (d1 - d2)
+
+        smi = 0.0 if d2 == 0 else 200.0 * (n2 / d2)
+        sig = smi if i == 0 else sig + ks * (smi - sig)
 
-    sig = ema_series(smi, lengthEMA)
     return smi, sig
 
 
@@ -330,84 +392,98 @@ def compute_overall_weighted(
     return state, score, comps
 
 
-def build_hourly(source_js: Optional[dict], hourly_url: str) -> dict:
-    prev_js = {}
-    try:
-        prev_js = fetch_json(hourly_url) or {}
-    except Exception:
-        prev_js = {}
-
-    cards: List[dict] = []
-    cards_fresh = False
-
-    if isinstance(source_js, dict):
-        if isinstance(source_js.get("sectorCards"), list):
-            cards = source_js["sectorCards"]
-            cards_fresh = True
-        elif isinstance(source_js.get("sectors"), list):
-            cards = source_js["sectors"]
-            cards_fresh = True
-
-    if not cards:
-        try:
-            h = prev_js if prev_js else fetch_json(hourly_url)
-            cards = h.get("sectorCards") or h.get("sectors") or []
-            cards_fresh = False
-        except Exception:
-            cards = []
-            cards_fresh = False
-
+def sector_card_tallies(cards: List[dict]) -> Tuple[float, float, float, float]:
+    """
+    One pass over sectorCards -> (breadth %, momentum %, rising %, risk-on %).
+    breadth/momentum: sum(nh)/(nh+nl) and sum(up)/(up+down).
+    rising: cards with breadth_pct >= 55 and momentum_pct >= 55, over cards carrying both.
+    risk-on: offensive sectors with breadth >= 55 and defensive sectors with breadth <= 45,
+    over the sectors that carry a numeric breadth (last card per sector wins).
+    Each figure falls back to 50.0 when nothing counts toward it.
+    """
     NH = NL = UP = DN = 0.0
+    rising_good = rising_total = 0
+    votes: dict = {}
+
     for c in cards or []:
         NH += float(c.get("nh", 0))
         NL += float(c.get("nl", 0))
         UP += float(c.get("up", 0))
         DN += float(c.get("down", 0))
 
-    breadth_slow = round(pct(NH, NH + NL), 2) if (NH + NL) > 0 else 50.0
-    momentum_slow = round(pct(UP, UP + DN), 2) if (UP + DN) > 0 else 50.0
-
-    rising_good = 0
-    rising_total = 0
-
-    for c in cards or []:
         bp = c.get("breadth_pct")
+        bp_ok = isinstance(bp, (int, float))
         mp = c.get("momentum_pct")
 
-        if isinstance(bp, (int, float)) and isinstance(mp, (int, float)):
+        if bp_ok and isinstance(mp, (int, float)):
             rising_total += 1
             if float(bp) >= 55.0 and float(mp) >= 55.0:
                 rising_good += 1
 
-    rising_pct = round(pct(rising_good, rising_total), 2) if rising_total > 0 else 50.0
+        sec = (c.get("sector") or "").strip().lower()
+        side = SECTOR_SIDE.get(sec)
+        if side is None:
+            continue
+        if bp_ok:
+            votes[sec] = 1 if (float(bp) >= 55.0 if side > 0 else float(bp) <= 45.0) else 0
+        else:
+            votes[sec] = None
 
-    by = {(c.get("sector") or "").strip().lower(): c for c in cards or []}
     ro_score = ro_den = 0
-
-    for s in OFFENSIVE:
-        bp = by.get(s, {}).get("breadth_pct")
-        if isinstance(bp, (int, float)):
+    for v in votes.values():
+        if v is not None:
             ro_den += 1
-            if float(bp) >= 55.0:
-                ro_score += 1
+            ro_score += v
 
-    for s in DEFENSIVE:
-        bp = by.get(s, {}).get("breadth_pct")
-        if isinstance(bp, (int, float)):
-            ro_den += 1
-            if float(bp) <= 45.0:
-                ro_score += 1
+    breadth = round(pct(NH, NH + NL), 2) if (NH + NL) > 0 else 50.0
+    momentum = round(pct(UP, UP + DN), 2) if (UP + DN) > 0 else 50.0
+    rising = round(pct(rising_good, rising_total), 2) if rising_total > 0 else 50.0
+    risk_on = round(pct(ro_score, ro_den), 2) if ro_den > 0 else 50.0
+    return breadth, momentum, rising, risk_on
 
-    risk_on_pct = round(pct(ro_score, ro_den), 2) if ro_den > 0 else 50.0
 
+def _fetch_prev_hourly(hourly_url: str) -> dict:
+    try:
+        return fetch_json(hourly_url) or {}
+    except Exception:
+        return {}
+
+
+def build_hourly(source_js: Optional[dict], hourly_url: str) -> dict:
     key = os.environ.get("POLYGON_API_KEY") or os.environ.get("POLY_API_KEY") or os.environ.get("POLY_KEY") or ""
 
-    spy_1h: List[dict] = []
-    spy_4h: List[dict] = []
+    # The previous payload and the two SPY pulls are independent round-trips, so they
+    # overlap; wall time is the slowest of the three instead of their sum.
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        f_prev = ex.submit(_fetch_prev_hourly, hourly_url)
+        f_1h = ex.submit(fetch_polygon_bars, POLY_1H_URL, key, "SPY", FETCH_DAYS_1H) if key else None
+        f_4h = ex.submit(fetch_polygon_bars, POLY_4H_URL, key, "SPY", FETCH_DAYS_4H_ANCHOR) if key else None
+
+        prev_js = f_prev.result()
+        spy_1h: List[dict] = f_1h.result() if f_1h else []
+        spy_4h: List[dict] = f_4h.result() if f_4h else []
+
+    cards: List[dict] = []
+    cards_fresh = False
 
-    if key:
-        spy_1h = fetch_polygon_bars(POLY_1H_URL, key, "SPY", lookback_days=FETCH_DAYS_1H)
-        spy_4h = fetch_polygon_bars(POLY_4H_URL, key, "SPY", lookback_days=FETCH_DAYS_4H_ANCHOR)
+    if isinstance(source_js, dict):
+        if isinstance(source_js.get("sectorCards"), list):
+            cards = source_js["sectorCards"]
+            cards_fresh = True
+        elif isinstance(source_js.get("sectors"), list):
+            cards = source_js["sectors"]
+            cards_fresh = True
+
+    if not cards:
+        try:
+            h = prev_js if prev_js else fetch_json(hourly_url)
+            cards = h.get("sectorCards") or h.get("sectors") or []
+            cards_fresh = False
+        except Exception:
+            cards = []
+            cards_fresh = False
+
+    breadth_slow, momentum_slow, rising_pct, risk_on_pct = sector_card_tallies(cards)
 
     ema_sign = 0
     ema_dist_pct = 0.0
@@ -421,24 +497,25 @@ def build_hourly(source_js: Optional[dict], hourly_url: str) -> dict:
     squeeze_psi_1h = None
     squeeze_exp_1h = 50.0
 
-    if len(spy_1h) >= 25:
-        H = [b["high"] for b in spy_1h]
-        L = [b["low"] for b in spy_1h]
-        C = [b["close"] for b in spy_1h]
+    # Columns are pulled out of the 1H bar dicts once and shared by every block below.
+    H = list(map(itemgetter("high"), spy_1h))
+    L = list(map(itemgetter("low"), spy_1h))
+    C = list(map(itemgetter("close"), spy_1h))
 
-        e10 = ema_series(C, 10)
+    if len(spy_1h) >= 25:
+        e10 = ema_last(C, 10)
 
-        if e10[-1] and e10[-1] != 0:
-            ema_dist_pct = 100.0 * (C[-1] - e10[-1]) / e10[-1]
+        if e10:
+            ema_dist_pct = 100.0 * (C[-1] - e10) / e10
 
         ema_sign = 1 if ema_dist_pct > 0 else (-1 if ema_dist_pct < 0 else 0)
         ema10_posture = posture_from_dist(ema_dist_pct, FULL_EMA_DIST)
 
-        smi_series, sig_series = tv_smi_and_signal(H, L, C, SMI_K_LEN, SMI_D_LEN, SMI_EMA_LEN)
+        smi_last, sig_last = tv_smi_last(H, L, C, SMI_K_LEN, SMI_D_LEN, SMI_EMA_LEN)
 
-        if smi_series and sig_series:
-            smi_1h = float(smi_series[-1])
-            smi_sig_1h = float(sig_series[-1])
+        if smi_last is not None and sig_last is not None:
+            smi_1h = float(smi_last)
+            smi_sig_1h = float(sig_last)
             smi_pct_1h = smi_to_pct(smi_1h)
 
         psi = lux_psi_stateful(C, conv=50, length=20)
@@ -448,14 +525,14 @@ def build_hourly(source_js: Optional[dict], hourly_url: str) -> dict:
             squeeze_exp_1h = clamp(100.0 - squeeze_psi_1h, 0.0, 100.0)
 
     if len(spy_4h) >= 25:
-        H4 = [b["high"] for b in spy_4h]
-        L4 = [b["low"] for b in spy_4h]
-        C4 = [b["close"] for b in spy_4h]
+        H4 = list(map(itemgetter("high"), spy_4h))
+        L4 = list(map(itemgetter("low"), spy_4h))
+        C4 = list(map(itemgetter("close"), spy_4h))
 
-        smi4, sig4 = tv_smi_and_signal(H4, L4, C4, SMI_K_LEN, SMI_D_LEN, SMI_EMA_LEN)
+        smi4, sig4 = tv_smi_last(H4, L4, C4, SMI_K_LEN, SMI_D_LEN, SMI_EMA_LEN)
 
-        if smi4 and sig4:
-            smi_pct_4h = smi_to_pct(float(smi4[-1]))
+        if smi4 is not None and sig4 is not None:
+            smi_pct_4h = smi_to_pct(float(smi4))
 
     momentum_combo_1h = float(ema10_posture)
 
@@ -489,18 +566,13 @@ def build_hourly(source_js: Optional[dict], hourly_url: str) -> dict:
     volatility_1h_scaled = 0.0
 
     if len(spy_1h) >= 3:
-        V = [b["volume"] for b in spy_1h]
-        C = [b["close"] for b in spy_1h]
-        H = [b["high"] for b in spy_1h]
-        L = [b["low"] for b in spy_1h]
+        V = list(map(itemgetter("volume"), spy_1h))
 
-        v3 = ema_last(V, 3)
-        v12 = ema_last(V, 12)
+        v3, v12 = ema_pair_last(V, 3, 12)
 
         liquidity_1h = 0.0 if not v12 or v12 <= 0 else clamp(100.0 * (v3 / v12), 0.0, 200.0)
 
-        trs = tr_series(H, L, C)
-        atr = ema_last(trs, 3) if trs else None
+        atr = atr_ema_last(H, L, C, 3)
 
         volatility_1h_pct = 0.0 if not atr or C[-1] <= 0 else max(0.0, 100.0 * atr / C[-1])
         volatility_1h_scaled = round(float(volatility_1h_pct) * 6.25, 2)
@@ -610,10 +682,7 @@ def main():
 
     out = build_hourly(source_js=src, hourly_url=args.hourly_url)
 
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
-
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, separators=(",", ":"))
+    write_json_atomic(args.out, out, ensure_ascii=False, separators=(",", ":"))
 
     ov = out.get("hourly", {}).get("overall1h", {})
 